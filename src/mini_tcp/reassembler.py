@@ -1,86 +1,90 @@
-from collections import deque
+from bisect import bisect_left, bisect_right
 from src.util.byte_stream import ByteStream
+from src.mini_tcp.tcp_config import MAX_OOO_SEGMENTS
 
 class Reassembler:
-    def __init__(self, output: ByteStream):
+    def __init__(self, output: ByteStream, max_ooo_segments: int = MAX_OOO_SEGMENTS):
         self.output = output
         self.unass_base = 0  # Index of the first unassembled byte
-        # self.unass_size = 0  # Amount of unassembled but stored data
+        self.unass_size = 0  # Amount of unassembled but stored data
         self.window_size = output.capacity
-        # Use deque for efficient operations at both ends
-        # self.buffer = deque([0] * self.window_size, maxlen=self.window_size)
-        # self.bitmap = deque([False] * self.window_size, maxlen=self.window_size)
+        # Ring buffer indexed by stream index % window_size: bytes are written straight to their
+        # final position and never moved, the window is never wider than the output capacity
         self.buffer = bytearray(self.window_size)
-        self.bitmap = bytearray(self.window_size)
+        self.view = memoryview(self.buffer)
+        # Stored ranges [start, end) of stream indexes, kept sorted, disjoint and non-adjacent,
+        # so the ranges touched by a new segment can be found with a binary search
+        self.starts = []
+        self.ends = []
+        self.max_ooo_segments = max_ooo_segments
+        self.ooo_drop_count = 0  # Number of stored ranges dropped to respect max_ooo_segments
         self.eof = False  # Flag indicating end of file
 
-    @property
-    def unass_size(self):
-        return self.bitmap.count(1)
+    def add_range(self, start: int, end: int) -> None:
+        # find the stored ranges that overlap or touch [start, end) and merge them into one
+        lo = bisect_left(self.ends, start)
+        hi = bisect_right(self.starts, end)
+        covered = 0
+        if lo < hi:
+            for i in range(lo, hi):
+                covered += self.ends[i] - self.starts[i]
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+        self.unass_size += end - start - covered
+
+    def write(self, start: int, data: memoryview) -> None:
+        # copy data into the ring at the position of stream index start, wrapping if needed
+        pos = start % self.window_size
+        first_part = min(len(data), self.window_size - pos)
+        self.view[pos:pos + first_part] = data[:first_part]
+        if first_part < len(data):
+            self.view[:len(data) - first_part] = data[first_part:]
 
     def check_contiguous(self):
-        # find contiguous segment
-        count = 0
-        for i in range(self.window_size):
-            if not self.bitmap[i]:
-                break
-            count += 1
-        
-        if count > 0:
-            self.output.push(bytes(self.buffer[:count]))
-            self.buffer[:-count] = self.buffer[count:]
-            self.buffer[-count:] = b'\x00' * count
-            self.bitmap[:-count] = self.bitmap[count:]
-            self.bitmap[-count:] = b'\x00' * count
-            self.unass_base += count
+        # push the first stored range if it starts at the next expected byte
+        if not self.starts or self.starts[0] != self.unass_base:
+            return
+        count = self.ends[0] - self.unass_base
+        pos = self.unass_base % self.window_size
+        first_part = min(count, self.window_size - pos)
+        self.output.push(self.view[pos:pos + first_part])
+        if first_part < count:
+            self.output.push(self.view[:count - first_part])
+        del self.starts[0]
+        del self.ends[0]
+        self.unass_base += count
+        self.unass_size -= count
+    
+    def drop_excess_ranges(self):
+        # drop the highest-offset ranges first, they are the least likely to be assembled soon
+        while len(self.starts) > self.max_ooo_segments:
+            self.unass_size -= self.ends.pop() - self.starts.pop()
+            self.ooo_drop_count += 1
+            # the dropped range may hold the end of the stream, wait for the FIN again
+            self.eof = False
     
     def insert(self, index: int, data: bytes, eof: bool) -> None:
         data_len = len(data)
-        # ignore segment that beyond window
-        if index >= self.unass_base + self.window_size:
-            return
-        # If the segment starts after current unassembled base
-        if index >= self.unass_base:
-            offset = index - self.unass_base
-            # calculate actual length can store in window
-            real_len = min(data_len, self.output.available_capacity() - offset)
+        first_unacceptable = self.unass_base + self.output.available_capacity()
 
-            # if we can store all data, set eof
-            if real_len >= data_len and eof:
-                self.eof = True
+        # if we can store all data, set eof
+        if eof and index + data_len <= first_unacceptable:
+            self.eof = True
 
-            # Ensure buffer and bitmap have enough space
-            while len(self.buffer) < self.window_size:
-                self.buffer.append(0)
-                self.bitmap.append(False)
-            
-            # store data in buffer if it is not a empty segment
-            if real_len > 0:
-                self.buffer[offset:offset+real_len] = data[:real_len]
-                self.bitmap[offset:offset+real_len] = b'\x01' * real_len
+        # trim the segment to the part inside the window that has not been assembled yet
+        start = max(index, self.unass_base)
+        end = min(index + data_len, first_unacceptable)
+        if start < end:
+            self.write(start, memoryview(data)[start - index:end - index])
+            self.add_range(start, end)
 
-        # else, if segment overlaps with current processing position
-        elif index + data_len > self.unass_base:
-            offset = self.unass_base - index
-            # calculate actual length can store in window
-            real_len = min(data_len - offset, self.output.available_capacity())
+            # check contiguous
+            self.check_contiguous()
 
-            # if we can store all data, set eof
-            if real_len >= data_len and eof:
-                self.eof = True
-
-            # Ensure buffer and bitmap have enough space
-            while len(self.buffer) < self.window_size:
-                self.buffer.append(0)
-                self.bitmap.append(False)
-
-            # store data in buffer
-            for i in range(real_len):
-                self.buffer[i] = data[offset + i]
-                self.bitmap[i] = True
-
-        # check contiguous
-        self.check_contiguous()
+            # keep the number of out-of-order ranges bounded
+            self.drop_excess_ranges()
 
         # if eof and no unassembled data, closed output
         if self.eof and self.unass_size == 0:
@@ -97,4 +101,4 @@ class Reassembler:
 
     def set_error(self) -> None:
         self.output.set_error()
-    
\ No newline at end of file
+    
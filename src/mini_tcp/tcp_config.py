@@ -10,6 +10,7 @@ INITIAL_RTO = 1000
 MAX_SEQNO = 2**32 - 1
 MAX_RETX_ATTEMPTS = 10
 MAX_RETRANSMISSION_TIME = 60000
+MAX_OOO_SEGMENTS = 1448 # out-of-order ranges the reassembler keeps before dropping
 
 @dataclass
 class TCPConfig:
@@ -8,7 +8,8 @@ class TCPReceiverMessage:
     window_size: int = 0
     RST: bool = False
 
-@dataclass
+# slots: one of these is built for every segment, skip the per-instance __dict__
+@dataclass(slots=True)
 class TCPSenderMessage:
     seqno: Optional[Wrap32] = None
     payload: Optional[bytes] = None
@@ -1,6 +1,7 @@
 from src.mini_tcp.reassembler import Reassembler
 from src.mini_tcp.tcp_message import TCPReceiverMessage
 from src.mini_tcp.wrapping_intergers import Wrap32
+from src.mini_tcp.tcp_config import MAX_WINDOW_SIZE
 
 class TCPReceiver:
     def __init__(self, reassembler: Reassembler):
@@ -8,14 +9,20 @@ class TCPReceiver:
         self.isn = 0
         self.syn_received = False
         self.fin_received = False
+        self.window_size = self.window_size_for(reassembler.window_size)
+        # last message built by send(), dropped on every receive() and reused until then
+        # as long as the application has not read from the stream (which moves the window)
+        self._cached_send = None
+        self._cached_popped = 0
+
+    @staticmethod
+    def window_size_for(capacity: int) -> int:
         # window size is at most 65535 (16bits)
-        self.window_size = 0;
-        if reassembler.window_size < 65535:
-            self.window_size = reassembler.window_size
-        else:
-            self.window_size = 65535
+        return min(capacity, MAX_WINDOW_SIZE)
 
     def receive(self, message: TCPReceiverMessage):
+        self._cached_send = None
+
         if message.SYN:
             self.isn = message.seqno
             self.syn_received = True
@@ -41,7 +48,12 @@ class TCPReceiver:
         if message.FIN:
             self.fin_received = True
 
+    # the returned message may be shared between calls, callers must not modify it
     def send(self):
+        bytes_popped = self.reassembler.output.bytes_popped()
+        if self._cached_send is not None and self._cached_popped == bytes_popped:
+            return self._cached_send
+
         msg = TCPReceiverMessage()
 
         if self.syn_received:
@@ -55,4 +67,6 @@ class TCPReceiver:
         if self.reassembler.has_error():
             msg.RST = True
 
+        self._cached_send = msg
+        self._cached_popped = bytes_popped
         return msg
\ No newline at end of file
@@ -23,6 +23,12 @@ class TCPSender:
         self.fin_sent = False
         self.recv_zero_window_size = False # we need to probe if we receive a zero window size
 
+    # how many sequence numbers are sent but not yet acknowledged
+    @property
+    def seqnos_in_flight(self) -> int:
+        return min(self.next_seqno, self.fin_seqno) - self.ack_seqno
+
+    # the message is only read during the call and not kept, so callers may reuse it
     def receive(self, message: TCPReceiverMessage):
         # if RST is set, set the stream error
         if message.RST:
@@ -1,5 +1,7 @@
 # Wrap32 is a class that represents a 32-bit segment integer that has been wrapped around a 64-bit absolute sequence number
 class Wrap32:
+    __slots__ = ('raw_value',)
+
     def __init__(self, raw_value):
         self.raw_value = raw_value & 0xFFFFFFFF  # Ensure it's a 32-bit unsigned integer
     
@@ -24,23 +26,19 @@ class Wrap32:
             64-bit absolute sequence number corresponding to the current Wrap32,
             which is closest to the checkpoint
         """
-        tmp = 0
-        tmp1 = 0
-        n_minus_isn = self.raw_value - zero_point.raw_value
-        if n_minus_isn < 0:
-            tmp = n_minus_isn + (1 << 32)
-        else:
-            tmp = n_minus_isn
+        # offset from the zero point, the masking handles the wrap of n - isn
+        tmp = (self.raw_value - zero_point.raw_value) & 0xFFFFFFFF
         
         # if tmp is greater than or equal to checkpoint, return tmp
         if tmp >= checkpoint:
             return tmp
         
         # calculate the high 32 bits
-        tmp |= ((checkpoint >> 32) << 32)
+        tmp |= checkpoint & ~0xFFFFFFFF
         
-        # find the smallest value greater than checkpoint
-        while tmp <= checkpoint:
+        # find the smallest value greater than checkpoint, the low 32 bits of checkpoint are
+        # below 2^32 so one step is always enough
+        if tmp <= checkpoint:
             tmp += (1 << 32)
         
         # calculate the value smaller than tmp by 2^32
@@ -56,7 +54,12 @@ class Wrap32:
         return Wrap32((self.raw_value + (n & 0xFFFFFFFF)) & 0xFFFFFFFF)
     
     def __eq__(self, other):
+        if other.__class__ is not Wrap32:
+            return NotImplemented
         return self.raw_value == other.raw_value
+
+    def __hash__(self):
+        return self.raw_value
     
     def __repr__(self):
         return f"Wrap32({self.raw_value})"
\ No newline at end of file
@@ -45,6 +45,8 @@ class ByteStream:
             return b""
         if n > len(self.buffer):
             n = len(self.buffer)
+        if n == 0:
+            return b""
         return self.buffer.peek(n)
 
     def pop(self, n: int) -> bytes:
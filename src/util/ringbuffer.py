@@ -45,34 +45,23 @@ class RingBuffer:
             raise ValueError("Pop size must be positive")
         if n == 0:
             return bytes()
-            
-        result = bytearray(n)
-        if self.head + n <= self.capacity:
-            # Can copy in one go
-            result[:] = self.buffer[self.head:self.head + n]
-        else:
-            # Need to split the copy
-            first_part = self.capacity - self.head
-            result[:first_part] = self.buffer[self.head:]
-            result[first_part:] = self.buffer[:n - first_part]
-            
+
+        result = self.peek(n)
         self.head = (self.head + n) % self.capacity
         self.size -= n
-        return bytes(result)
+        return result
 
     def peek(self, n: int) -> bytes:
         if n > self.size:
             raise ValueError("Not enough elements to peek")
-        result = bytearray(n)
+        # slice through a memoryview so the data is copied only once, into the result
+        view = memoryview(self.buffer)
         if self.head + n <= self.capacity:
             # Can copy in one go
-            result[:] = self.buffer[self.head:self.head + n]
-        else:
-            # Need to split the copy
-            first_part = self.capacity - self.head
-            result[:first_part] = self.buffer[self.head:]
-            result[first_part:] = self.buffer[:n - first_part]
-        return bytes(result)
+            return bytes(view[self.head:self.head + n])
+        # Need to split the copy
+        first_part = self.capacity - self.head
+        return b"".join((view[self.head:], view[:n - first_part]))
 
     def get_size(self) -> int:
         """
@@ -53,6 +53,42 @@ class TestReassembler(unittest.TestCase):
         self.assertEqual(self.output.bytes_buffered(), len(expected_output))
         self.assertEqual(self.output.pop(len(expected_output)), expected_output)
 
+    def test_overlapping_out_of_order_segments(self):
+        self.reassembler.insert(2, b"cd", False)
+        self.reassembler.insert(6, b"ghi", True)
+        self.reassembler.insert(3, b"def", False)  # Overlaps the first range and touches the second
+        self.assertEqual(self.reassembler.count_bytes_pending(), 7)
+        self.reassembler.insert(1, b"bcdefgh", False)  # Subsumes everything stored
+        self.assertEqual(self.reassembler.count_bytes_pending(), 8)
+        self.assertEqual(self.output.bytes_buffered(), 0)
+        self.assertFalse(self.output.is_closed())
+        self.reassembler.insert(0, b"ab", False)
+        self.assertEqual(self.reassembler.count_bytes_pending(), 0)
+        self.assertTrue(self.output.is_closed())
+        self.assertEqual(self.output.pop(9), b"abcdefghi")
+
+    def test_out_of_order_segments_limit(self):
+        reassembler = Reassembler(self.output, max_ooo_segments=2)
+        reassembler.insert(2, b"c", False)
+        reassembler.insert(6, b"g", False)
+        reassembler.insert(4, b"e", False)  # Third range, the highest one is dropped
+        self.assertEqual(reassembler.ooo_drop_count, 1)
+        self.assertEqual(reassembler.count_bytes_pending(), 2)
+        reassembler.insert(0, b"abcdef", False)
+        self.assertEqual(reassembler.count_bytes_pending(), 0)
+        self.assertEqual(self.output.pop(6), b"abcdef")
+
+    def test_insert_wraps_around_window(self):
+        output = ByteStream(8)
+        reassembler = Reassembler(output)
+        reassembler.insert(0, b"abcdef", False)
+        self.assertEqual(output.pop(6), b"abcdef")
+        reassembler.insert(9, b"jklm", False)  # Stored across the end of the window
+        self.assertEqual(reassembler.count_bytes_pending(), 4)
+        reassembler.insert(6, b"ghi", False)
+        self.assertEqual(reassembler.count_bytes_pending(), 0)
+        self.assertEqual(output.pop(7), b"ghijklm")
+
 class TestReassemblerPerformance(unittest.TestCase):
     def measure_throughput(self, packet_size: int, num_operations: int, out_of_order: bool = False) -> float:
         # Create fresh instances for each test
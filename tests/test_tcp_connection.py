@@ -1,5 +1,6 @@
 import unittest
 import random
+from collections import deque
 from src.mini_tcp.tcp_connection import TCPConnection
 from src.mini_tcp.tcp_message import TCPMessage, TCPSenderMessage, TCPReceiverMessage
 from src.mini_tcp.wrapping_intergers import Wrap32
@@ -14,7 +15,7 @@ class TCPConnectionTestHarness:
             isn=isn.raw_value
         )
         self.connection = TCPConnection(config)
-        self.segments_received = []
+        self.segments_received = deque()
         
         def mock_transmit(segment: TCPMessage) -> None:
             self.segments_received.append(segment)
@@ -50,7 +51,7 @@ class TCPConnectionTestHarness:
         if not self.segments_received:
             raise AssertionError(f"{self.test_name}: Expected a segment but none were sent!")
             
-        seg = self.segments_received.pop(0)
+        seg = self.segments_received.popleft()
         
         if syn:
             assert seg.sender_message.SYN, f"{self.test_name}: Expected SYN flag but didn't get it"
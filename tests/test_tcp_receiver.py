@@ -4,32 +4,47 @@ from src.mini_tcp.tcp_message import TCPSenderMessage
 from src.mini_tcp.wrapping_intergers import Wrap32
 from src.util.byte_stream import ByteStream
 from src.mini_tcp.reassembler import Reassembler
+from src.mini_tcp.tcp_config import MAX_OOO_SEGMENTS
 import random
 
+class Wrap32Table:
+    """Cache of Wrap32(isn + k) values, so repeated seqnos in a test share one object"""
+    def __init__(self, isn: int):
+        self.isn = isn
+        self._cache = {}
+
+    def __getitem__(self, k: int) -> Wrap32:
+        seqno = self._cache.get(k)
+        if seqno is None:
+            seqno = self._cache[k] = Wrap32(self.isn + k)
+        return seqno
+
 class TCPReceiverTestHarness:
-    def __init__(self, test_name, capacity):
+    def __init__(self, test_name, capacity, max_ooo_segments=MAX_OOO_SEGMENTS):
         self.test_name = test_name
         self.output = ByteStream(capacity)
-        self.reassembler = Reassembler(self.output)
+        self.reassembler = Reassembler(self.output, max_ooo_segments=max_ooo_segments)
         self.receiver = TCPReceiver(self.reassembler)
 
-    def execute(self, action):
-        action(self.receiver)
-
     def read_all(self) -> bytes:
         """Read all available data from the output stream"""
-        data = self.output.peek(self.output.bytes_buffered())
-        self.output.pop(len(data))
-        return data
+        n = self.output.bytes_buffered()
+        if not n:
+            return b""
+        return self.output.pop(n)
 
 class TestTCPReceiver(unittest.TestCase):
+    def setUp(self):
+        # Seeded with the test id, so each test gets its own ISNs and sees them again on every run
+        self.rng = random.Random(self.id())
+
     def test_connect_1(self):
         test = TCPReceiverTestHarness("connect 1", 4000)
         self.assertEqual(test.receiver.send().window_size, 4000)
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(0), payload=b"", SYN=True)))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(0), payload=b"", SYN=True))
         self.assertEqual(test.receiver.send().ackno, Wrap32(1))
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
@@ -39,7 +54,7 @@ class TestTCPReceiver(unittest.TestCase):
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(89347598), payload=b"", SYN=True)))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(89347598), payload=b"", SYN=True))
         self.assertEqual(test.receiver.send().ackno, Wrap32(89347599))
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
@@ -49,7 +64,7 @@ class TestTCPReceiver(unittest.TestCase):
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(893475), payload=b"", SYN=False)))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(893475), payload=b"", SYN=False))
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
@@ -59,7 +74,7 @@ class TestTCPReceiver(unittest.TestCase):
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(893475), payload=b"", FIN=True)))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(893475), payload=b"", FIN=True))
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
@@ -69,174 +84,225 @@ class TestTCPReceiver(unittest.TestCase):
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(893475), payload=b"", FIN=True)))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(893475), payload=b"", FIN=True))
         self.assertIsNone(test.receiver.send().ackno)
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(89347598), payload=b"", SYN=True)))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(89347598), payload=b"", SYN=True))
         self.assertEqual(test.receiver.send().ackno, Wrap32(89347599))
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
 
     def test_connect_6(self):
         test = TCPReceiverTestHarness("connect 6", 4000)
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(5), payload=b"", SYN=True, FIN=True)))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(5), payload=b"", SYN=True, FIN=True))
         self.assertTrue(test.output.is_closed())
         self.assertEqual(test.receiver.send().ackno, Wrap32(7))
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 0)
 
     def test_window_size(self):
-        # Test window size zero
-        test = TCPReceiverTestHarness("window size zero", 0)
-        self.assertEqual(test.receiver.send().window_size, 0)
-
-        # Test window size 50
-        test = TCPReceiverTestHarness("window size 50", 50)
-        self.assertEqual(test.receiver.send().window_size, 50)
-
-        # Test window size at max (65535)
-        test = TCPReceiverTestHarness("window size at max", 65535)
-        self.assertEqual(test.receiver.send().window_size, 65535)
+        # Only the clamped window is checked, so no ByteStream is needed
+        self.assertEqual(TCPReceiver.window_size_for(0), 0)
+        self.assertEqual(TCPReceiver.window_size_for(50), 50)
+        self.assertEqual(TCPReceiver.window_size_for(65535), 65535)
+        self.assertEqual(TCPReceiver.window_size_for(65536), 65535)
+        self.assertEqual(TCPReceiver.window_size_for(65540), 65535)
+        self.assertEqual(TCPReceiver.window_size_for(10000000), 65535)
 
-        # Test window size at max+1
-        test = TCPReceiverTestHarness("window size at max+1", 65536)
-        self.assertEqual(test.receiver.send().window_size, 65535)
+    def test_window_size_end_to_end(self):
+        # Zero and oversized capacities through a real receiver, including data that does not fit
+        for capacity, window_size in ((0, 0), (65536, 65535), (100000, 65535)):
+            with self.subTest(capacity=capacity):
+                test = TCPReceiverTestHarness(f"window size {capacity}", capacity)
+                self.assertEqual(test.receiver.send().window_size, window_size)
+                test.receiver.receive(TCPSenderMessage(seqno=Wrap32(0), payload=b"", SYN=True))
+                self.assertEqual(test.receiver.send().window_size, window_size)
+                test.receiver.receive(TCPSenderMessage(seqno=Wrap32(1), payload=b"ab"))
+                self.assertEqual(test.receiver.send().ackno, Wrap32(1 + min(capacity, 2)))
+                self.assertEqual(test.receiver.send().window_size, window_size - min(capacity, 2))
 
-        # Test window size at max+5
-        test = TCPReceiverTestHarness("window size at max+5", 65540)
-        self.assertEqual(test.receiver.send().window_size, 65535)
-
-        # Test window size at 10M
-        test = TCPReceiverTestHarness("window size at 10M", 10000000)
-        self.assertEqual(test.receiver.send().window_size, 65535)
+    def test_window_reopens_after_read(self):
+        test = TCPReceiverTestHarness("window reopens after read", 4000)
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(0), payload=b"", SYN=True))
+        test.receiver.receive(TCPSenderMessage(seqno=Wrap32(1), payload=b"abcd"))
+        self.assertEqual(test.receiver.send().window_size, 3996)
+        self.assertEqual(test.receiver.send().ackno, Wrap32(5))
+        self.assertEqual(test.read_all(), b"abcd")
+        self.assertEqual(test.receiver.send().window_size, 4000)
+        self.assertEqual(test.receiver.send().ackno, Wrap32(5))
 
     def test_in_window_later_segment(self):
         # Generate random ISN
-        isn = random.randint(0, 0xFFFFFFFF)
+        isn = self.rng.randint(0, 0xFFFFFFFF)
+        w = Wrap32Table(isn)
         test = TCPReceiverTestHarness("in-window, later segment", 2358)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn), payload=b"", SYN=True)))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[0], payload=b"", SYN=True))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 10), payload=b"abcd")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[10], payload=b"abcd"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 4)
         self.assertEqual(test.output.bytes_pushed(), 0)
 
     def test_in_window_later_segment_then_hole_filled(self):
-        isn = random.randint(0, 0xFFFFFFFF)
+        isn = self.rng.randint(0, 0xFFFFFFFF)
+        w = Wrap32Table(isn)
         test = TCPReceiverTestHarness("in-window, later segment, then hole filled", 2358)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn), payload=b"", SYN=True)))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[0], payload=b"", SYN=True))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 5), payload=b"efgh")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[5], payload=b"efgh"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 4)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 1), payload=b"abcd")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 9))
+        test.receiver.receive(TCPSenderMessage(seqno=w[1], payload=b"abcd"))
+        self.assertEqual(test.receiver.send().ackno, w[9])
         self.assertEqual(test.read_all(), b"abcdefgh")
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 8)
 
+    def test_hole_filled_across_seqno_wrap(self):
+        # ISN just below 2^32, so the data's sequence numbers wrap around to 0
+        w = Wrap32Table(0xFFFFFFFF - 3)
+        test = TCPReceiverTestHarness("hole filled across seqno wrap", 2358)
+        
+        test.receiver.receive(TCPSenderMessage(seqno=w[0], payload=b"", SYN=True))
+        self.assertEqual(test.receiver.send().ackno, w[1])
+        
+        test.receiver.receive(TCPSenderMessage(seqno=w[5], payload=b"efgh"))
+        self.assertEqual(w[5], Wrap32(1))
+        self.assertEqual(test.receiver.send().ackno, w[1])
+        self.assertEqual(test.reassembler.count_bytes_pending(), 4)
+        
+        test.receiver.receive(TCPSenderMessage(seqno=w[1], payload=b"abcd"))
+        self.assertEqual(test.receiver.send().ackno, w[9])
+        self.assertEqual(test.read_all(), b"abcdefgh")
+        self.assertEqual(test.reassembler.count_bytes_pending(), 0)
+
+    def test_out_of_order_segments_limit(self):
+        isn = self.rng.randint(0, 0xFFFFFFFF)
+        w = Wrap32Table(isn)
+        test = TCPReceiverTestHarness("out-of-order segments limit", 2358, max_ooo_segments=2)
+        
+        test.receiver.receive(TCPSenderMessage(seqno=w[0], payload=b"", SYN=True))
+        test.receiver.receive(TCPSenderMessage(seqno=w[2], payload=b"b"))
+        test.receiver.receive(TCPSenderMessage(seqno=w[4], payload=b"d"))
+        self.assertEqual(test.reassembler.count_bytes_pending(), 2)
+        
+        # A third gap goes over the limit, the highest range is dropped
+        test.receiver.receive(TCPSenderMessage(seqno=w[6], payload=b"f"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
+        self.assertEqual(test.reassembler.ooo_drop_count, 1)
+        self.assertEqual(test.reassembler.count_bytes_pending(), 2)
+        self.assertEqual(test.output.bytes_pushed(), 0)
+        
+        test.receiver.receive(TCPSenderMessage(seqno=w[1], payload=b"abcdef"))
+        self.assertEqual(test.receiver.send().ackno, w[7])
+        self.assertEqual(test.read_all(), b"abcdef")
+        self.assertEqual(test.reassembler.count_bytes_pending(), 0)
+
     def test_hole_filled_bit_by_bit(self):
-        isn = random.randint(0, 0xFFFFFFFF)
+        isn = self.rng.randint(0, 0xFFFFFFFF)
+        w = Wrap32Table(isn)
         test = TCPReceiverTestHarness("hole filled bit-by-bit", 2358)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn), payload=b"", SYN=True)))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[0], payload=b"", SYN=True))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 5), payload=b"efgh")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[5], payload=b"efgh"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 4)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 1), payload=b"ab")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 3))
+        test.receiver.receive(TCPSenderMessage(seqno=w[1], payload=b"ab"))
+        self.assertEqual(test.receiver.send().ackno, w[3])
         self.assertEqual(test.read_all(), b"ab")
         self.assertEqual(test.reassembler.count_bytes_pending(), 4)
         self.assertEqual(test.output.bytes_pushed(), 2)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 3), payload=b"cd")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 9))
+        test.receiver.receive(TCPSenderMessage(seqno=w[3], payload=b"cd"))
+        self.assertEqual(test.receiver.send().ackno, w[9])
         self.assertEqual(test.read_all(), b"cdefgh")
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 8)
 
     def test_many_gaps_filled_bit_by_bit(self):
-        isn = random.randint(0, 0xFFFFFFFF)
+        isn = self.rng.randint(0, 0xFFFFFFFF)
+        w = Wrap32Table(isn)
         test = TCPReceiverTestHarness("many gaps, filled bit-by-bit", 2358)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn), payload=b"", SYN=True)))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[0], payload=b"", SYN=True))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 5), payload=b"e")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[5], payload=b"e"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 1)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 7), payload=b"g")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[7], payload=b"g"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 2)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 3), payload=b"c")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[3], payload=b"c"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 3)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 1), payload=b"ab")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 4))
+        test.receiver.receive(TCPSenderMessage(seqno=w[1], payload=b"ab"))
+        self.assertEqual(test.receiver.send().ackno, w[4])
         self.assertEqual(test.read_all(), b"abc")
         self.assertEqual(test.reassembler.count_bytes_pending(), 2)
         self.assertEqual(test.output.bytes_pushed(), 3)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 6), payload=b"f")))
+        test.receiver.receive(TCPSenderMessage(seqno=w[6], payload=b"f"))
         self.assertEqual(test.reassembler.count_bytes_pending(), 3)
         self.assertEqual(test.output.bytes_pushed(), 3)
         self.assertEqual(test.read_all(), b"")
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 4), payload=b"d")))
+        test.receiver.receive(TCPSenderMessage(seqno=w[4], payload=b"d"))
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 7)
         self.assertEqual(test.read_all(), b"defg")
 
     def test_many_gaps_then_subsumed(self):
-        isn = random.randint(0, 0xFFFFFFFF)
+        isn = self.rng.randint(0, 0xFFFFFFFF)
+        w = Wrap32Table(isn)
         test = TCPReceiverTestHarness("many gaps, then subsumed", 2358)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn), payload=b"", SYN=True)))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[0], payload=b"", SYN=True))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 5), payload=b"e")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[5], payload=b"e"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 1)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 7), payload=b"g")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[7], payload=b"g"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 2)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 3), payload=b"c")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 1))
+        test.receiver.receive(TCPSenderMessage(seqno=w[3], payload=b"c"))
+        self.assertEqual(test.receiver.send().ackno, w[1])
         self.assertEqual(test.read_all(), b"")
         self.assertEqual(test.reassembler.count_bytes_pending(), 3)
         self.assertEqual(test.output.bytes_pushed(), 0)
         
-        test.execute(lambda r: r.receive(TCPSenderMessage(seqno=Wrap32(isn + 1), payload=b"abcdefgh")))
-        self.assertEqual(test.receiver.send().ackno, Wrap32(isn + 9))
+        test.receiver.receive(TCPSenderMessage(seqno=w[1], payload=b"abcdefgh"))
+        self.assertEqual(test.receiver.send().ackno, w[9])
         self.assertEqual(test.read_all(), b"abcdefgh")
         self.assertEqual(test.reassembler.count_bytes_pending(), 0)
         self.assertEqual(test.output.bytes_pushed(), 8)
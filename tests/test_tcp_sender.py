@@ -1,42 +1,89 @@
 import unittest
 import random
+from collections import deque
+import string
+from itertools import accumulate
+from typing import Optional, Union
 from src.mini_tcp.tcp_sender import TCPSender
-from src.mini_tcp.tcp_message import TCPReceiverMessage, TCPSenderMessage
+from src.mini_tcp.tcp_message import TCPReceiverMessage
 from src.mini_tcp.wrapping_intergers import Wrap32
 from src.util.byte_stream import ByteStream
 from src.mini_tcp.tcp_config import INITIAL_RTO, MAX_RETX_ATTEMPTS
 
+def _as_bytes(data: Union[str, bytes, bytearray]) -> Union[bytes, bytearray]:
+    """Payload as given to the harness, bytes-like data is used as is and only str is encoded"""
+    return data if isinstance(data, (bytes, bytearray)) else data.encode()
+
+# The alphabet twice, so any run of up to 26 letters starting at any letter is one slice
+ALPHABET_RING = string.ascii_lowercase.encode() * 2
+
+def short_write_rounds(rng: random.Random, n_rounds: int, max_block_size: int):
+    """Block sizes, stream offsets and payloads of the many-short-writes tests, computed before the rounds run.
+
+    offsets has n_rounds + 1 entries, the last one is the total number of bytes written.
+    Round i's payload is the repeated alphabet starting at letter i.
+    """
+    assert max_block_size <= 26, "payloads are slices of ALPHABET_RING"
+    # One randbytes call instead of a randint per round, the small modulo bias does not matter here
+    block_sizes = [b % max_block_size + 1 for b in rng.randbytes(n_rounds)]
+    offsets = list(accumulate(block_sizes, initial=0))
+    payloads = [ALPHABET_RING[i % 26:i % 26 + n] for i, n in enumerate(block_sizes)]
+    return block_sizes, offsets, payloads
+
+# Retransmission timeouts the retx tests run with, from barely above a tick to several seconds
+RETX_TIMEOUTS = (37, 250, 4096, 9973)
+
 class TCPSenderTestHarness:
-    def __init__(self, test_name: str, capacity: int = 4000, retx_timeout: int = INITIAL_RTO):
+    __slots__ = ('test_name', 'input', 'isn', 'sender', 'segments_sent', 'max_retx_exceeded', '_rcv_msg')
+
+    def __init__(self, test_name: str, capacity: int = 4000, retx_timeout: int = INITIAL_RTO,
+                 isn: Optional[Wrap32] = None, *, rng: random.Random):
         self.test_name = test_name
         self.input = ByteStream(capacity)
-        self.isn = Wrap32(random.randint(0, 0xFFFFFFFF))
+        self.isn = isn if isn is not None else Wrap32(rng.randrange(1 << 32))
         self.sender = TCPSender(self.input, self.isn, retx_timeout)
-        self.segments_sent = []
+        self.segments_sent = deque()
         self.max_retx_exceeded = False
-        
-        def mock_transmit(segment: TCPSenderMessage) -> int:
-            self.segments_sent.append(segment)
-            return len(segment.payload) if segment.payload else 0
-
-        self.mock_transmit = mock_transmit
+        # Refilled by every receive_ack, the sender does not keep the messages it receives
+        self._rcv_msg = TCPReceiverMessage()
 
-    def push(self, data: str = "", close: bool = False) -> None:
+    def push(self, data: Union[str, bytes, bytearray] = "", close: bool = False) -> None:
         """Push data to the sender's input stream"""
-        # Mock transmit function to capture sent segments
+        self.push_bytes(_as_bytes(data), close)
+
+    def push_bytes(self, data: bytes, close: bool = False) -> None:
+        """Push already encoded data to the sender's input stream"""
         if data:
-            self.input.push(data.encode())
+            self.input.push(data)
         if close:
             self.input.close()
-        self.sender.push(self.mock_transmit)
+        self.sender.push(self.segments_sent.append)
+    
+    def push_bulk_and_drain(self, payloads) -> list:
+        """Push each payload as a separate write and return all segments sent meanwhile, in order"""
+        push = self.input.push
+        sender_push = self.sender.push
+        transmit = self.segments_sent.append
+        for data in payloads:
+            push(data)
+            sender_push(transmit)
+        segments = list(self.segments_sent)
+        self.segments_sent.clear()
+        return segments
     
     def expect_message(self, *, no_flags: bool = True, syn: bool = False, fin: bool = False,
-                      data: str = "", payload_size: int = None, seqno: Wrap32 = None) -> None:
-        """Verify that the next message matches expectations"""
+                      data: Union[str, bytes, bytearray] = "", payload_size: int = None, seqno: Wrap32 = None) -> None:
+        """Verify that the next message matches expectations, see expect_message_bytes"""
+        self.expect_message_bytes(no_flags=no_flags, syn=syn, fin=fin, data=_as_bytes(data),
+                                  payload_size=payload_size, seqno=seqno)
+
+    def expect_message_bytes(self, *, no_flags: bool = True, syn: bool = False, fin: bool = False,
+                             data: bytes = b"", payload_size: int = None, seqno: Wrap32 = None) -> None:
+        """Verify that the next message matches expectations, data is compared as raw bytes"""
         if not self.segments_sent:
             raise AssertionError(f"{self.test_name}: Expected a segment but none were sent!")
             
-        seg = self.segments_sent.pop(0)
+        seg = self.segments_sent.popleft()
         
         if no_flags:
             assert not seg.SYN and not seg.FIN, f"{self.test_name}: Expected no flags but got SYN={seg.SYN}, FIN={seg.FIN}"
@@ -48,7 +95,7 @@ class TCPSenderTestHarness:
             assert seg.FIN, f"{self.test_name}: Expected FIN flag but didn't get it"
             
         if data:
-            assert seg.payload == data.encode(), f"{self.test_name}: Expected data '{data}' but got '{seg.payload.decode()}'"
+            assert seg.payload == data, f"{self.test_name}: Expected data {data!r} but got {seg.payload!r}"
             
         if payload_size is not None:
             actual_size = len(seg.payload) if seg.payload else 0
@@ -57,13 +104,24 @@ class TCPSenderTestHarness:
         if seqno is not None:
             assert seg.seqno == seqno, f"{self.test_name}: Expected seqno {seqno} but got {seg.seqno}"
     
+    def expect_data(self, data: Union[str, bytes, bytearray]) -> None:
+        """Verify that the next message carries exactly data and no flags, the common case of expect_message"""
+        if not self.segments_sent:
+            raise AssertionError(f"{self.test_name}: Expected a segment but none were sent!")
+        seg = self.segments_sent.popleft()
+        data = _as_bytes(data)
+        assert not seg.SYN and not seg.FIN and seg.payload == data, \
+            f"{self.test_name}: Expected data {data!r} without flags but got {seg}"
+
     def expect_no_segment(self) -> None:
         """Verify that no segments were sent"""
         assert not self.segments_sent, f"{self.test_name}: Expected no segments but got {len(self.segments_sent)}"
     
     def receive_ack(self, ackno: Wrap32, window_size: int = 1000) -> None:
         """Simulate receiving an ACK from the receiver"""
-        msg = TCPReceiverMessage(ackno=ackno, window_size=window_size)
+        msg = self._rcv_msg
+        msg.ackno = ackno
+        msg.window_size = window_size
         self.sender.receive(msg)
     
     def expect_seqno(self, seqno: Wrap32) -> None:
@@ -74,8 +132,9 @@ class TCPSenderTestHarness:
     
     def expect_seqnos_in_flight(self, n: int) -> None:
         """Verify the number of sequence numbers in flight"""
-        assert min(self.sender.next_seqno, self.sender.fin_seqno) - self.sender.ack_seqno == n, \
-            f"{self.test_name}: Expected {n} seqnos in flight but got {min(self.sender.next_seqno, self.sender.fin_seqno) - self.sender.ack_seqno}"
+        got = self.sender.seqnos_in_flight
+        if got != n:
+            raise AssertionError(f"{self.test_name}: Expected {n} seqnos in flight but got {got}")
     
     def expect_consecutive_retransmissions(self, n: int) -> None:
         """Verify the number of consecutive retransmissions"""
@@ -85,78 +144,115 @@ class TCPSenderTestHarness:
     def close(self) -> None:
         """Close the input stream"""
         self.input.close()
-        self.sender.push(self.mock_transmit)
+        self.sender.push(self.segments_sent.append)
     
     def tick(self, ms: int, expect_max_retx_exceeded: bool = False) -> None:
         """Advance time by the specified number of milliseconds"""
-        self.sender.tick(ms, self.mock_transmit)
+        self.sender.tick(ms, self.segments_sent.append)
         if expect_max_retx_exceeded:
             assert self.sender.retrans_count > MAX_RETX_ATTEMPTS, \
                 f"{self.test_name}: Expected max retransmissions exceeded but got {self.sender.retrans_count} retransmissions"
     
+    def tick_and_expect_no_timeout(self, ms: int, next_seqno: Wrap32, n_in_flight: int) -> None:
+        """Advance time short of a timeout: nothing is resent and the sequence numbers are unchanged"""
+        self.tick(ms)
+        self.expect_seqno(next_seqno)
+        self.expect_seqnos_in_flight(n_in_flight)
+        self.expect_no_segment()
+
+    def tick_and_expect_timeout(self, ms: int, next_seqno: Wrap32, n_in_flight: int, **message) -> None:
+        """Advance time to a timeout: exactly one segment, matching expect_message(**message), is resent"""
+        self.tick(ms)
+        self.expect_message(**message)
+        self.expect_seqno(next_seqno)
+        self.expect_seqnos_in_flight(n_in_flight)
+        self.expect_no_segment()
+    
+    def tick_until_max_retx(self, next_seqno: Wrap32, n_in_flight: int, **message) -> None:
+        """Run every backed-off timeout until the retransmission limit is exceeded: nothing is resent one ms
+        short of each timeout, then one segment matching expect_message(**message) is resent when it expires"""
+        rto = self.sender.initial_RTO
+        for attempt in range(MAX_RETX_ATTEMPTS):
+            self.tick_and_expect_no_timeout((rto << attempt) - 1, next_seqno, n_in_flight)
+            self.tick_and_expect_timeout(1, next_seqno, n_in_flight, **message)
+        self.tick_and_expect_no_timeout((rto << MAX_RETX_ATTEMPTS) - 1, next_seqno, n_in_flight)
+        self.tick(1, expect_max_retx_exceeded=True)
+    
     def has_error(self) -> bool:
         """Check if the sender has an error"""
         return self.input.has_error()
 
 class TestTCPSender(unittest.TestCase):
-    def test_repeat_ack_ignored(self):
-        """Test that repeated ACKs are ignored"""
-        test = TCPSenderTestHarness("Repeat ACK is ignored")
+    def setUp(self):
+        # Seeded with the test id, so ISNs, timeouts and sizes are the same on every run of a test,
+        # however many other tests run with it
+        self._rng = random.Random(self.id())
+
+    def harness(self, *args, **kwargs) -> TCPSenderTestHarness:
+        """Create a harness that draws its ISN from the test's generator"""
+        kwargs.setdefault("rng", self._rng)
+        return TCPSenderTestHarness(*args, **kwargs)
+
+    def post_handshake_harness(self, test_name: str, window_size: int = 1000, **kwargs) -> TCPSenderTestHarness:
+        """Create a harness whose SYN is sent and acked with window_size, checking every step of the handshake"""
+        test = self.harness(test_name, **kwargs)
 
         # Initial SYN
         test.push()
         test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
         test.expect_no_segment()
+        test.expect_seqno(test.isn + 1)
+        test.expect_seqnos_in_flight(1)
 
         # Receive ACK for SYN
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
+        test.receive_ack(test.isn + 1, window_size=window_size)
+        test.expect_no_segment()
+        test.expect_seqno(test.isn + 1)
+        test.expect_seqnos_in_flight(0)
+        return test
+
+    def test_repeat_ack_ignored(self):
+        """Test that repeated ACKs are ignored"""
+        test = self.post_handshake_harness("Repeat ACK is ignored")
 
         # Send some data
         test.push("a")
-        test.expect_message(data="a")
+        test.expect_data("a")
         test.expect_no_segment()
 
         # Receive same ACK again - should be ignored
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
+        test.receive_ack(test.isn + 1)
         test.expect_no_segment()
 
         self.assertFalse(test.has_error())
 
     def test_old_ack_ignored(self):
         """Test that old ACKs are ignored"""
-        test = TCPSenderTestHarness("Old ACK is ignored")
-
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_no_segment()
-
-        # Receive ACK for SYN
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
+        test = self.post_handshake_harness("Old ACK is ignored")
 
         # Send first data segment
         test.push("a")
-        test.expect_message(data="a")
+        test.expect_data("a")
         test.expect_no_segment()
 
         # Receive ACK for first data
-        test.receive_ack(Wrap32(test.isn.raw_value + 2))
+        test.receive_ack(test.isn + 2)
         test.expect_no_segment()
 
         # Send second data segment
         test.push("b")
-        test.expect_message(data="b")
+        test.expect_data("b")
         test.expect_no_segment()
 
         # Receive old ACK - should be ignored
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
+        test.receive_ack(test.isn + 1)
         test.expect_no_segment()
 
         self.assertFalse(test.has_error())
 
     def test_impossible_ackno_ignored(self):
         """Test that impossible ACKs (beyond next seqno) are ignored"""
-        test = TCPSenderTestHarness("Impossible ackno (beyond next seqno) is ignored")
+        test = self.harness("Impossible ackno (beyond next seqno) is ignored")
 
         # Initial SYN
         test.push()
@@ -166,47 +262,34 @@ class TestTCPSender(unittest.TestCase):
         test.expect_seqnos_in_flight(1)
 
         # Receive impossible ACK
-        test.receive_ack(Wrap32(test.isn.raw_value + 2), window_size=1000)
+        test.receive_ack(test.isn + 2, window_size=1000)
 
         # Should still have the same bytes in flight
         test.expect_seqnos_in_flight(1)
 
         self.assertFalse(test.has_error())
 
-    def test_fin_sent(self):
-        """Test sending FIN flag"""
-        test = TCPSenderTestHarness("FIN sent test")
-
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-
-        # Receive ACK for SYN
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+    def fin_sent_harness(self, test_name: str) -> TCPSenderTestHarness:
+        """Run the SYN, ACK, close sequence shared by the FIN tests, up to the FIN being in flight"""
+        test = self.post_handshake_harness(test_name)
 
         # Close the stream
         test.close()
         test.expect_message(no_flags=False, fin=True, seqno=test.isn + 1)
         test.expect_seqno(test.isn + 2)
         test.expect_seqnos_in_flight(1)
+        return test
+
+    def test_fin_sent(self):
+        """Test sending FIN flag"""
+        test = self.fin_sent_harness("FIN sent test")
         test.expect_no_segment()
 
         self.assertFalse(test.has_error())
 
     def test_fin_with_data(self):
         """Test sending FIN with data"""
-        test = TCPSenderTestHarness("FIN with data")
-
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-
-        # Receive ACK for SYN
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+        test = self.post_handshake_harness("FIN with data")
 
         # Push data and close
         test.push("hello", close=True)
@@ -217,7 +300,7 @@ class TestTCPSender(unittest.TestCase):
 
     def test_syn_fin(self):
         """Test sending SYN and FIN together"""
-        test = TCPSenderTestHarness("SYN + FIN")
+        test = self.harness("SYN + FIN")
 
         # Set window size without pushing
         test.receive_ack(None, window_size=1024)
@@ -233,24 +316,10 @@ class TestTCPSender(unittest.TestCase):
 
     def test_fin_acked(self):
         """Test FIN being acknowledged"""
-        test = TCPSenderTestHarness("FIN acked test")
-
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-
-        # Receive ACK for SYN
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
-
-        # Close and send FIN
-        test.close()
-        test.expect_message(no_flags=False, fin=True, seqno=test.isn + 1)
-        test.expect_seqnos_in_flight(1)
+        test = self.fin_sent_harness("FIN acked test")
 
         # Receive ACK for FIN
-        test.receive_ack(Wrap32(test.isn.raw_value + 2))
+        test.receive_ack(test.isn + 2)
         test.expect_seqno(test.isn + 2)
         test.expect_seqnos_in_flight(0)
         test.expect_no_segment()
@@ -259,75 +328,35 @@ class TestTCPSender(unittest.TestCase):
 
     def test_fin_not_acked(self):
         """Test unacknowledged FIN"""
-        test = TCPSenderTestHarness("FIN not acked test")
-
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-
-        # Receive ACK for SYN
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
-
-        # Close and send FIN
-        test.close()
-        test.expect_message(no_flags=False, fin=True, seqno=test.isn + 1)
-        test.expect_seqno(test.isn + 2)
-        test.expect_seqnos_in_flight(1)
+        test = self.fin_sent_harness("FIN not acked test")
 
         # Receive old ACK (not acknowledging FIN)
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
+        test.receive_ack(test.isn + 1)
         test.expect_seqno(test.isn + 2)
         test.expect_seqnos_in_flight(1)
         test.expect_no_segment()
 
     def test_fin_retx(self):
         """Test FIN retransmission"""
-        test = TCPSenderTestHarness("FIN retx test")
-
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-
-        # Receive ACK for SYN
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
-
-        # Close and send FIN
-        test.close()
-        test.expect_message(no_flags=False, fin=True, seqno=test.isn + 1)
-        test.expect_seqno(test.isn + 2)
-        test.expect_seqnos_in_flight(1)
+        test = self.fin_sent_harness("FIN retx test")
 
         # Receive old ACK (not acknowledging FIN)
-        test.receive_ack(Wrap32(test.isn.raw_value + 1))
+        test.receive_ack(test.isn + 1)
         test.expect_seqno(test.isn + 2)
         test.expect_seqnos_in_flight(1)
         test.expect_no_segment()
 
         # Wait just before timeout
-        test.tick(INITIAL_RTO - 1)
-        test.expect_seqno(test.isn + 2)
-        test.expect_seqnos_in_flight(1)
-        test.expect_no_segment()
+        test.tick_and_expect_no_timeout(INITIAL_RTO - 1, test.isn + 2, 1)
 
         # Timeout occurs
-        test.tick(1)
-        test.expect_message(no_flags=False, fin=True, seqno=test.isn + 1)
-        test.expect_seqno(test.isn + 2)
-        test.expect_seqnos_in_flight(1)
-        test.expect_no_segment()
+        test.tick_and_expect_timeout(1, test.isn + 2, 1, no_flags=False, fin=True, seqno=test.isn + 1)
 
         # Additional tick
-        test.tick(1)
-        test.expect_seqno(test.isn + 2)
-        test.expect_seqnos_in_flight(1)
-        test.expect_no_segment()
+        test.tick_and_expect_no_timeout(1, test.isn + 2, 1)
 
         # Finally receive ACK for FIN
-        test.receive_ack(Wrap32(test.isn.raw_value + 2))
+        test.receive_ack(test.isn + 2)
         test.expect_seqnos_in_flight(0)
         test.expect_seqno(test.isn + 2)
         test.expect_no_segment()
@@ -337,7 +366,7 @@ class TestTCPSender(unittest.TestCase):
     # Test SYN
     def test_syn_sent_after_first_push(self):
         """Test that SYN is sent after first push"""
-        test = TCPSenderTestHarness("SYN sent after first push")
+        test = self.harness("SYN sent after first push")
         
         # Initial push should trigger SYN
         test.push()
@@ -349,7 +378,7 @@ class TestTCPSender(unittest.TestCase):
 
     def test_syn_acked(self):
         """Test SYN being acknowledged"""
-        test = TCPSenderTestHarness("SYN acked test")
+        test = self.harness("SYN acked test")
         
         # Send SYN
         test.push()
@@ -364,7 +393,7 @@ class TestTCPSender(unittest.TestCase):
 
     def test_syn_wrong_ack(self):
         """Test SYN receiving wrong acknowledgment"""
-        test = TCPSenderTestHarness("SYN -> wrong ack test")
+        test = self.harness("SYN -> wrong ack test")
         
         # Send SYN
         test.push()
@@ -380,18 +409,7 @@ class TestTCPSender(unittest.TestCase):
 
     def test_syn_acked_with_data(self):
         """Test sending data after SYN is acknowledged"""
-        test = TCPSenderTestHarness("SYN acked, data")
-        
-        # Send SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Receive ACK for SYN
-        test.receive_ack(test.isn + 1)
-        test.expect_no_segment()
-        test.expect_seqnos_in_flight(0)
+        test = self.post_handshake_harness("SYN acked, data")
         
         # Send data
         test.push("abcdefgh")
@@ -409,129 +427,96 @@ class TestTCPSender(unittest.TestCase):
     # Test Retx
     def test_retx_syn_twice_then_ack(self):
         """Test retransmitting SYN twice at the right times, then acknowledge"""
-        retx_timeout = random.randint(10, 10000)
-        test = TCPSenderTestHarness("Retx SYN twice at the right times, then ack", retx_timeout=retx_timeout)
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_no_segment()
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Wait just before timeout
-        test.tick(retx_timeout - 1)
-        test.expect_no_segment()
-        
-        # First retransmission
-        test.tick(1)
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Wait just before second timeout (doubled)
-        test.tick(2 * retx_timeout - 1)
-        test.expect_no_segment()
-        
-        # Second retransmission
-        test.tick(1)
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Finally receive ACK
-        test.receive_ack(test.isn + 1)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
-        
-        self.assertFalse(test.has_error())
+        for retx_timeout in RETX_TIMEOUTS:
+            with self.subTest(retx_timeout=retx_timeout):
+                test = self.harness("Retx SYN twice at the right times, then ack", retx_timeout=retx_timeout)
+        
+                # Initial SYN
+                test.push()
+                test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
+                test.expect_no_segment()
+                test.expect_seqno(test.isn + 1)
+                test.expect_seqnos_in_flight(1)
+        
+                # Wait just before timeout
+                test.tick(retx_timeout - 1)
+                test.expect_no_segment()
+        
+                # First retransmission
+                test.tick(1)
+                test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
+                test.expect_seqno(test.isn + 1)
+                test.expect_seqnos_in_flight(1)
+        
+                # Wait just before second timeout (doubled)
+                test.tick(2 * retx_timeout - 1)
+                test.expect_no_segment()
+        
+                # Second retransmission
+                test.tick(1)
+                test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
+                test.expect_seqno(test.isn + 1)
+                test.expect_seqnos_in_flight(1)
+        
+                # Finally receive ACK
+                test.receive_ack(test.isn + 1)
+                test.expect_seqno(test.isn + 1)
+                test.expect_seqnos_in_flight(0)
+        
+                self.assertFalse(test.has_error())
 
     def test_retx_syn_until_too_many(self):
         """Test retransmitting SYN until max retransmissions exceeded"""
-        retx_timeout = random.randint(10, 10000)
-        test = TCPSenderTestHarness("Retx SYN until too many retransmissions", retx_timeout=retx_timeout)
+        for retx_timeout in RETX_TIMEOUTS:
+            with self.subTest(retx_timeout=retx_timeout):
+                test = self.harness("Retx SYN until too many retransmissions", retx_timeout=retx_timeout)
         
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_no_segment()
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
+                # Initial SYN
+                test.push()
+                test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
+                test.expect_no_segment()
+                test.expect_seqno(test.isn + 1)
+                test.expect_seqnos_in_flight(1)
         
-        # Retransmit until max attempts
-        for attempt in range(MAX_RETX_ATTEMPTS):
-            # Wait just before timeout
-            test.tick((retx_timeout << attempt) - 1, expect_max_retx_exceeded=False)
-            test.expect_no_segment()
-            
-            # Timeout and retransmit
-            test.tick(1, expect_max_retx_exceeded=False)
-            test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-            test.expect_seqno(test.isn + 1)
-            test.expect_seqnos_in_flight(1)
-        
-        # Final timeout should exceed max retransmissions
-        test.tick((retx_timeout << MAX_RETX_ATTEMPTS) - 1, expect_max_retx_exceeded=False)
-        test.tick(1, expect_max_retx_exceeded=True)
+                # Retransmit until max attempts, the final timeout exceeds max retransmissions
+                test.tick_until_max_retx(test.isn + 1, 1, no_flags=False, syn=True, payload_size=0, seqno=test.isn)
 
     def test_retx_with_data(self):
         """Test retransmission with data segments"""
-        retx_timeout = random.randint(10, 10000)
-        test = TCPSenderTestHarness("Send some data, then retx and succeed, then retx till limit", retx_timeout=retx_timeout)
-        
-        # Initial SYN and ACK
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_no_segment()
-        test.receive_ack(test.isn + 1)
-        
-        # Send first data segment
-        test.push("abcd")
-        test.expect_message(payload_size=4)
-        test.expect_no_segment()
-        test.receive_ack(test.isn + 5)
-        test.expect_seqnos_in_flight(0)
-        
-        # Send second data segment
-        test.push("efgh")
-        test.expect_message(payload_size=4)
-        test.expect_no_segment()
-        
-        # Retransmit after timeout
-        test.tick(retx_timeout)
-        test.expect_message(payload_size=4)
-        test.expect_no_segment()
-        
-        # Receive ACK and send new data
-        test.receive_ack(test.isn + 9)
-        test.expect_seqnos_in_flight(0)
-        test.push("ijkl")
-        test.expect_message(payload_size=4, seqno=test.isn + 9)
-        
-        # Retransmit until max attempts
-        for attempt in range(MAX_RETX_ATTEMPTS):
-            test.tick((retx_timeout << attempt) - 1, expect_max_retx_exceeded=False)
-            test.expect_no_segment()
-            test.tick(1, expect_max_retx_exceeded=False)
-            test.expect_message(payload_size=4, seqno=test.isn + 9)
-            test.expect_seqnos_in_flight(4)
-        
-        # Final timeout should exceed max retransmissions
-        test.tick((retx_timeout << MAX_RETX_ATTEMPTS) - 1, expect_max_retx_exceeded=False)
-        test.tick(1, expect_max_retx_exceeded=True)
+        for retx_timeout in RETX_TIMEOUTS:
+            with self.subTest(retx_timeout=retx_timeout):
+                test = self.post_handshake_harness("Send some data, then retx and succeed, then retx till limit", retx_timeout=retx_timeout)
+        
+                # Send first data segment
+                test.push("abcd")
+                test.expect_message(payload_size=4)
+                test.expect_no_segment()
+                test.receive_ack(test.isn + 5)
+                test.expect_seqnos_in_flight(0)
+        
+                # Send second data segment
+                test.push("efgh")
+                test.expect_message(payload_size=4)
+                test.expect_no_segment()
+        
+                # Retransmit after timeout
+                test.tick(retx_timeout)
+                test.expect_message(payload_size=4)
+                test.expect_no_segment()
+        
+                # Receive ACK and send new data
+                test.receive_ack(test.isn + 9)
+                test.expect_seqnos_in_flight(0)
+                test.push("ijkl")
+                test.expect_message(payload_size=4, seqno=test.isn + 9)
+        
+                # Retransmit until max attempts, the final timeout exceeds max retransmissions
+                test.tick_until_max_retx(test.isn + 13, 4, payload_size=4, seqno=test.isn + 9)
 
     def test_retx_earliest_packet(self):
         """Test retransmission of earliest unacknowledged packet"""
-        retx_timeout = random.randint(10, 10000)
-        test = TCPSenderTestHarness("Retx after multiple sends, retx earliest packet", retx_timeout=retx_timeout)
-        
-        # Initial SYN and ACK
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_no_segment()
-        test.expect_seqnos_in_flight(1)
-        test.receive_ack(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+        retx_timeout = self._rng.randint(10, 10000)
+        test = self.post_handshake_harness("Retx after multiple sends, retx earliest packet", retx_timeout=retx_timeout)
         
         # Send segment A
         test.push("A")
@@ -576,16 +561,8 @@ class TestTCPSender(unittest.TestCase):
 
     def test_timer_correctness(self):
         """Test timer behavior and retransmission timing"""
-        retx_timeout = random.randint(10, 10000)
-        test = TCPSenderTestHarness("timer correctness", retx_timeout=retx_timeout)
-        
-        # Initial SYN and ACK
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_no_segment()
-        test.expect_seqnos_in_flight(1)
-        test.receive_ack(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+        retx_timeout = self._rng.randint(10, 10000)
+        test = self.post_handshake_harness("timer correctness", retx_timeout=retx_timeout)
         
         # Timer should not trigger when no data in flight
         test.tick(retx_timeout)
@@ -594,7 +571,7 @@ class TestTCPSender(unittest.TestCase):
         
         # Send data
         test.push("a")
-        test.expect_message(data="a")
+        test.expect_data("a")
         
         # Short tick should not trigger retransmission
         test.tick(1)
@@ -603,7 +580,7 @@ class TestTCPSender(unittest.TestCase):
         
         # Timeout should trigger retransmission
         test.tick(retx_timeout - 1)
-        test.expect_message(data="a")
+        test.expect_data("a")
         test.expect_seqnos_in_flight(1)
         
         # Acknowledge data
@@ -615,18 +592,7 @@ class TestTCPSender(unittest.TestCase):
 
     def test_three_short_writes(self):
         """Test three consecutive short writes"""
-        test = TCPSenderTestHarness("Three short writes")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Receive ACK for SYN
-        test.receive_ack(test.isn + 1)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+        test = self.post_handshake_harness("Three short writes")
         
         # First write
         test.push("ab")
@@ -642,91 +608,102 @@ class TestTCPSender(unittest.TestCase):
         test.expect_seqno(test.isn + 9)
         test.expect_seqnos_in_flight(8)
 
-    def test_many_short_writes_continuous_acks(self):
-        """Test many short writes with continuous acknowledgments"""
-        test = TCPSenderTestHarness("Many short writes, continuous acks")
+    def test_seqno_wrap(self):
+        """Test sending and acking data whose sequence numbers wrap past 2^32"""
+        test = self.post_handshake_harness("Seqno wrap", isn=Wrap32(0xFFFFFFFF - 2))
         
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.receive_ack(test.isn + 1)
-        test.expect_seqno(test.isn + 1)
+        # Bytes at isn + 1 .. isn + 4, the last two wrap to 0 and 1
+        test.push("abcd")
+        test.expect_message(data="abcd", seqno=Wrap32(0xFFFFFFFE))
+        test.expect_seqno(Wrap32(2))
+        test.expect_seqnos_in_flight(4)
+        
+        # Ack up to the wrap, then past it
+        test.receive_ack(Wrap32(0))
+        test.expect_seqnos_in_flight(2)
+        test.receive_ack(Wrap32(2))
         test.expect_seqnos_in_flight(0)
         
+        # An ack from before the wrap is old and ignored
+        test.receive_ack(Wrap32(0xFFFFFFFF))
+        test.expect_seqnos_in_flight(0)
+        test.expect_no_segment()
+        
+        test.push("ef")
+        test.expect_message(data="ef", seqno=Wrap32(2))
+        test.expect_seqno(Wrap32(4))
+        test.expect_seqnos_in_flight(2)
+
+    def test_binary_payload(self):
+        """Test that payloads which are not valid UTF-8 go through untouched"""
+        test = self.post_handshake_harness("Binary payload")
+        
+        test.push(b"\x00\xff\x80")
+        test.expect_message(data=b"\x00\xff\x80", seqno=test.isn + 1)
+        test.push(b"\xc3")
+        test.expect_data(b"\xc3")
+        test.push(bytearray(b"\xfe\x00"))
+        test.expect_data(bytearray(b"\xfe\x00"))
+        test.expect_seqno(test.isn + 7)
+        test.expect_seqnos_in_flight(6)
+
+    def test_many_short_writes_continuous_acks(self):
+        """Test many short writes with continuous acknowledgments"""
+        test = self.post_handshake_harness("Many short writes, continuous acks")
+        
         # Multiple rounds of writes and acks
         max_block_size = 10
         n_rounds = 10000
-        bytes_sent = 0
+        block_sizes, _, payloads = short_write_rounds(self._rng, n_rounds, max_block_size)
         
-        for i in range(n_rounds):
-            # Generate random data
-            block_size = random.randint(1, max_block_size)
-            data = ''.join(chr(ord('a') + ((i + j) % 26)) for j in range(block_size))
-            
-            test.expect_seqno(test.isn + bytes_sent + 1)
-            test.push(data)
-            bytes_sent += block_size
+        # Sequence number of the next byte, advanced once per round
+        seqno = test.isn + 1
+        for block_size, data in zip(block_sizes, payloads):
+            test.expect_seqno(seqno)
+            test.push_bytes(data)
             test.expect_seqnos_in_flight(block_size)
-            test.expect_message(seqno=test.isn + 1 + (bytes_sent - block_size), data=data)
-            test.expect_no_segment()
-            test.receive_ack(test.isn + 1 + bytes_sent)
+            # A stray extra segment would be taken by the next round's check and fail it,
+            # so one expect_no_segment after the loop is enough
+            test.expect_message_bytes(seqno=seqno, data=data)
+            seqno = seqno + block_size
+            test.receive_ack(seqno)
+        test.expect_no_segment()
 
     def test_many_short_writes_ack_at_end(self):
         """Test many short writes with acknowledgment at the end"""
-        test = TCPSenderTestHarness("Many short writes, ack at end")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Receive ACK for SYN with large window
-        test.receive_ack(test.isn + 1, window_size=65000)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+        test = self.post_handshake_harness("Many short writes, ack at end", window_size=65000)
         
         # Multiple rounds of writes
         max_block_size = 10
         n_rounds = 1000
-        bytes_sent = 0
+        block_sizes, offsets, payloads = short_write_rounds(self._rng, n_rounds, max_block_size)
         
-        for i in range(n_rounds):
-            # Generate random data
-            block_size = random.randint(1, max_block_size)
-            data = ''.join(chr(ord('a') + ((i + j) % 26)) for j in range(block_size))
-            
-            test.expect_seqno(test.isn + bytes_sent + 1)
-            test.push(data)
-            bytes_sent += block_size
-            test.expect_seqnos_in_flight(bytes_sent)
-            test.expect_message(seqno=test.isn + 1 + (bytes_sent - block_size), data=data)
-            test.expect_no_segment()
+        # The window holds every round, so each write goes out as its own segment straight away
+        segments = test.push_bulk_and_drain(payloads)
+        self.assertEqual(len(segments), n_rounds)
+        
+        # Sequence number of the next byte, advanced once per round
+        seqno = test.isn + 1
+        for seg, block_size, data in zip(segments, block_sizes, payloads):
+            self.assertFalse(seg.SYN or seg.FIN)
+            self.assertEqual(seg.seqno, seqno)
+            self.assertEqual(seg.payload, data)
+            seqno = seqno + block_size
+        test.expect_seqno(seqno)
         
         # Final acknowledgment
-        test.expect_seqnos_in_flight(bytes_sent)
-        test.receive_ack(test.isn + 1 + bytes_sent)
+        test.expect_seqnos_in_flight(offsets[-1])
+        test.receive_ack(seqno)
         test.expect_seqnos_in_flight(0)
 
     def test_window_filling(self):
         """Test filling and respecting the window size"""
-        test = TCPSenderTestHarness("Window filling")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Receive ACK with window size 3
-        test.receive_ack(test.isn + 1, window_size=3)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+        test = self.post_handshake_harness("Window filling", window_size=3)
         
         # Try to send more than window size
         test.push("01234567")
         test.expect_seqnos_in_flight(3)
-        test.expect_message(data="012")
+        test.expect_data("012")
         test.expect_no_segment()
         test.expect_seqno(test.isn + 4)
         
@@ -734,7 +711,7 @@ class TestTCPSender(unittest.TestCase):
         test.receive_ack(test.isn + 4, window_size=3)
         test.push()
         test.expect_seqnos_in_flight(3)
-        test.expect_message(data="345")
+        test.expect_data("345")
         test.expect_no_segment()
         test.expect_seqno(test.isn + 7)
         
@@ -742,7 +719,7 @@ class TestTCPSender(unittest.TestCase):
         test.receive_ack(test.isn + 7, window_size=3)
         test.push()
         test.expect_seqnos_in_flight(2)
-        test.expect_message(data="67")
+        test.expect_data("67")
         test.expect_no_segment()
         test.expect_seqno(test.isn + 9)
         
@@ -753,65 +730,38 @@ class TestTCPSender(unittest.TestCase):
 
     def test_immediate_writes_respect_window(self):
         """Test that immediate writes respect the window size"""
-        test = TCPSenderTestHarness("Immediate writes respect the window")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(1)
-        
-        # Receive ACK with window size 3
-        test.receive_ack(test.isn + 1, window_size=3)
-        test.expect_seqno(test.isn + 1)
-        test.expect_seqnos_in_flight(0)
+        test = self.post_handshake_harness("Immediate writes respect the window", window_size=3)
         
         # First write fits in window
         test.push("01")
         test.expect_seqnos_in_flight(2)
-        test.expect_message(data="01")
+        test.expect_data("01")
         test.expect_no_segment()
         test.expect_seqno(test.isn + 3)
         
         # Second write partially fits in window
         test.push("23")
         test.expect_seqnos_in_flight(3)
-        test.expect_message(data="2")
+        test.expect_data("2")
         test.expect_no_segment()
         test.expect_seqno(test.isn + 4)
 
     def test_initial_receiver_window_respected(self):
         """Test that initial receiver advertised window is respected"""
-        test = TCPSenderTestHarness("Initial receiver advertised window is respected")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        
-        # Receive ACK with window size 4
-        test.receive_ack(test.isn + 1, window_size=4)
-        test.expect_no_segment()
+        test = self.post_handshake_harness("Initial receiver advertised window is respected", window_size=4)
         
         # Try to send more than window size
         test.push("abcdefg")
-        test.expect_message(data="abcd")
+        test.expect_data("abcd")
         test.expect_no_segment()
 
     def test_immediate_window_respected(self):
         """Test that immediate window is respected"""
-        test = TCPSenderTestHarness("Immediate window is respected")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        
-        # Receive ACK with window size 6
-        test.receive_ack(test.isn + 1, window_size=6)
-        test.expect_no_segment()
+        test = self.post_handshake_harness("Immediate window is respected", window_size=6)
         
         # Send data up to window size
         test.push("abcdefg")
-        test.expect_message(data="abcdef")
+        test.expect_data("abcdef")
         test.expect_no_segment()
 
     def test_random_window_sizes(self):
@@ -821,8 +771,8 @@ class TestTCPSender(unittest.TestCase):
         N_REPS = 1000
         
         for i in range(N_REPS):
-            window_size = random.randint(MIN_WIN, MAX_WIN)
-            test = TCPSenderTestHarness(f"Window {i}")
+            window_size = self._rng.randint(MIN_WIN, MAX_WIN)
+            test = self.harness(f"Window {i}")
             
             # Initial SYN
             test.push()
@@ -839,42 +789,26 @@ class TestTCPSender(unittest.TestCase):
 
     def test_window_growth_exploited(self):
         """Test that window growth is properly exploited"""
-        test = TCPSenderTestHarness("Window growth is exploited")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        
-        # Receive ACK with initial window size 4
-        test.receive_ack(test.isn + 1, window_size=4)
-        test.expect_no_segment()
+        test = self.post_handshake_harness("Window growth is exploited", window_size=4)
         
         # Send data
         test.push("0123456789")
-        test.expect_message(data="0123")
+        test.expect_data("0123")
         
         # Window grows, send more data
         test.receive_ack(test.isn + 5, window_size=5)
         test.push()
-        test.expect_message(data="45678")
+        test.expect_data("45678")
         test.expect_no_segment()
 
     def test_fin_occupies_window_space(self):
         """Test that FIN flag occupies space in window"""
-        test = TCPSenderTestHarness("FIN flag occupies space in window")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        
-        # Receive ACK with window size 7
-        test.receive_ack(test.isn + 1, window_size=7)
-        test.expect_no_segment()
+        test = self.post_handshake_harness("FIN flag occupies space in window", window_size=7)
         
         # Send data and close
         test.push("1234567")
         test.close()
-        test.expect_message(data="1234567")
+        test.expect_data("1234567")
         test.expect_no_segment()  # window is full
         
         # Window opens up by 1, send FIN
@@ -885,20 +819,12 @@ class TestTCPSender(unittest.TestCase):
 
     def test_fin_occupies_window_space_part2(self):
         """Test that FIN flag occupies space in window (part II)"""
-        test = TCPSenderTestHarness("FIN flag occupies space in window (part II)")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        
-        # Receive ACK with window size 7
-        test.receive_ack(test.isn + 1, window_size=7)
-        test.expect_no_segment()
+        test = self.post_handshake_harness("FIN flag occupies space in window (part II)", window_size=7)
         
         # Send data and close
         test.push("1234567")
         test.close()
-        test.expect_message(data="1234567")
+        test.expect_data("1234567")
         test.expect_no_segment()  # window is full
         
         # Window opens up to 8, send FIN
@@ -909,20 +835,12 @@ class TestTCPSender(unittest.TestCase):
 
     def test_piggyback_fin_when_space_available(self):
         """Test piggybacking FIN in segment when space is available"""
-        test = TCPSenderTestHarness("Piggyback FIN in segment when space is available")
-        
-        # Initial SYN
-        test.push()
-        test.expect_message(no_flags=False, syn=True, payload_size=0, seqno=test.isn)
-        
-        # Receive ACK with window size 3
-        test.receive_ack(test.isn + 1, window_size=3)
-        test.expect_no_segment()
+        test = self.post_handshake_harness("Piggyback FIN in segment when space is available", window_size=3)
         
         # Send data and close
         test.push("1234567")
         test.close()
-        test.expect_message(data="123")
+        test.expect_data("123")
         test.expect_no_segment()  # window is full
         
         # Window opens up, send remaining data with FIN
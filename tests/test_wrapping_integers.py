@@ -0,0 +1,48 @@
+import unittest
+from src.mini_tcp.wrapping_intergers import Wrap32
+
+class TestWrap32Unwrap(unittest.TestCase):
+    def test_unwrap_across_2_32(self):
+        zero = Wrap32(0)
+        self.assertEqual(Wrap32(0).unwrap(zero, (1 << 32) - 1), 1 << 32)
+        self.assertEqual(Wrap32((1 << 32) - 1).unwrap(zero, 1 << 32), (1 << 32) - 1)
+        self.assertEqual(Wrap32.wrap((1 << 32) + 5, zero).unwrap(zero, 1 << 32), (1 << 32) + 5)
+
+    def test_unwrap_checkpoint_between_candidates(self):
+        # 0 and 2^32 are both 2^31 away from the checkpoint, the higher one wins
+        self.assertEqual(Wrap32(0).unwrap(Wrap32(0), 1 << 31), 1 << 32)
+        # one below the midpoint, the lower candidate is closer
+        self.assertEqual(Wrap32(0).unwrap(Wrap32(0), (1 << 31) - 1), 0)
+
+    def test_unwrap_checkpoint_above_2_32(self):
+        zero = Wrap32(0)
+        self.assertEqual(Wrap32(10).unwrap(zero, 3 * (1 << 32) + 20), 3 * (1 << 32) + 10)
+        self.assertEqual(Wrap32(10).unwrap(zero, 3 * (1 << 32) + (1 << 31) + 11), 4 * (1 << 32) + 10)
+        self.assertEqual(Wrap32(0xFFFFFFFF).unwrap(zero, 3 * (1 << 32)), 3 * (1 << 32) - 1)
+
+    def test_unwrap_zero_point_above_raw_value(self):
+        zero = Wrap32((1 << 32) - 2)
+        self.assertEqual(Wrap32(3).unwrap(zero, 0), 5)
+        self.assertEqual(Wrap32(3).unwrap(zero, 1 << 32), (1 << 32) + 5)
+        self.assertEqual(Wrap32(zero.raw_value).unwrap(zero, 0), 0)
+
+class TestWrap32Equality(unittest.TestCase):
+    def test_equal_values_hash_equal(self):
+        self.assertEqual(Wrap32(7), Wrap32(7))
+        self.assertEqual(hash(Wrap32(7)), hash(Wrap32(7)))
+        self.assertEqual(Wrap32(1 << 32), Wrap32(0))
+        self.assertNotEqual(Wrap32(7), Wrap32(8))
+
+    def test_dict_key(self):
+        seqnos = {Wrap32(5): "a"}
+        self.assertEqual(seqnos[Wrap32(5)], "a")
+        self.assertEqual(seqnos[Wrap32(4) + 1], "a")
+        self.assertNotIn(Wrap32(6), seqnos)
+
+    def test_compare_with_other_types(self):
+        self.assertNotEqual(Wrap32(1), None)
+        self.assertNotEqual(Wrap32(1), 1)
+        self.assertIs(Wrap32(1).__eq__(1), NotImplemented)
+
+if __name__ == '__main__':
+    unittest.main()